@@ -0,0 +1,252 @@
+"""
+hw3-4-benchmark.py
+Parametric Benchmarks for the SMC Protocol
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import importlib.util
+
+# Import the main module (handle dashes in filename); reuses an already loaded copy
+try:
+    import hw3_4_smc_protocol as smc_module
+except ImportError:
+    spec = importlib.util.spec_from_file_location(
+        "hw3_4_smc_protocol",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "hw3-4-smc-protocol.py"))
+    smc_module = importlib.util.module_from_spec(spec)
+    sys.modules["hw3_4_smc_protocol"] = smc_module
+    spec.loader.exec_module(smc_module)
+
+
+REPORT_VERSION = 1
+PHASES = ["phase1", "phase2", "phase3", "phase4"]
+
+# Protocol keyword arguments per mode, given the party count
+MODES = {
+    "baseline": lambda parties: {},
+    "packing": lambda parties: {"packing": True},
+    "garbled": lambda parties: {"garbled": True},
+    "share_native": lambda parties: {"share_native": True},
+    "compressed": lambda parties: {"compressed_shares": True},
+    "threshold": lambda parties: {"threshold": parties // 2 + 1},
+    "cheap_aggregation": lambda parties: {"cheap_aggregation": True},
+}
+
+FULL_SWEEP = {
+    "key_bits": [512, 1024, 2048, 3072],
+    "lengths": [10, 100, 1000, 10**4, 10**5, 10**6],
+    "parties": [2, 4, 8],
+    "modes": list(MODES),
+    "backends": list(smc_module.BACKENDS),
+}
+
+
+def summarize(samples):
+    """Median, percentiles and spread of a list of timings (seconds)"""
+    ordered = sorted(samples)
+    if len(ordered) > 1:
+        deciles = statistics.quantiles(ordered, n=10, method="inclusive")
+        p10, p90 = deciles[0], deciles[-1]
+    else:
+        p10 = p90 = ordered[0]
+    return {
+        "median": statistics.median(ordered),
+        "p10": p10,
+        "p90": p90,
+        "min": ordered[0],
+        "max": ordered[-1],
+        "mean": statistics.fmean(ordered),
+        "repeats": len(ordered),
+    }
+
+
+def config_key(config):
+    """Stable identifier used to match results between two reports"""
+    return " ".join(f"{name}={config[name]}" for name in sorted(config))
+
+
+def run_once(keypair, vectors, mode, workers):
+    """Run all four phases once; returns seconds per phase"""
+    protocol = smc_module.NPartySMCProtocol(
+        vectors, verbose=False, workers=workers, keypair=keypair,
+        **MODES[mode](len(vectors))
+    )
+    timings = {}
+    for phase, run in zip(PHASES, [protocol.phase1_key_generation,
+                                   protocol.phase2_homomorphic_encryption,
+                                   protocol.phase3_secret_sharing,
+                                   protocol.phase4_secure_maximum]):
+        start = time.perf_counter()
+        run()
+        timings[phase] = time.perf_counter() - start
+    return timings
+
+
+def benchmark_config(keypair, length, parties, mode, warmup=1, repeats=5, workers=1, seed=0):
+    """Time one configuration: warmup runs are discarded, repeats are summarized"""
+    rng = random.Random(seed)
+    vectors = [[rng.randint(1, 1000) for _ in range(length)] for _ in range(parties)]
+    samples = {phase: [] for phase in PHASES + ["total"]}
+    for run in range(warmup + repeats):
+        timings = run_once(keypair, vectors, mode, workers)
+        if run < warmup:
+            continue
+        for phase, seconds in timings.items():
+            samples[phase].append(seconds)
+        samples["total"].append(sum(timings.values()))
+    return {phase: summarize(values) for phase, values in samples.items()}
+
+
+def run_sweep(key_bits=(512,), lengths=(10,), parties=(4,), modes=("baseline",),
+              backends=None, warmup=1, repeats=5, workers=1, log=print):
+    """
+    Benchmark every combination of the given parameters
+    Key pairs are generated once per key size (timed as "keygen") and
+    shared by all configurations; returns a JSON-serializable report
+    """
+    if backends is None:
+        backends = [smc_module.get_backend().name]
+    previous = smc_module.get_backend().name
+    results = []
+    try:
+        for backend in backends:
+            smc_module.set_backend(backend)
+            for bits in key_bits:
+                start = time.perf_counter()
+                keypair = smc_module.PaillierKeyPair(bits=bits, workers=workers)
+                keygen = time.perf_counter() - start
+                results.append({
+                    "config": {"backend": backend, "bits": bits, "benchmark": "keygen"},
+                    "phases": {"keygen": summarize([keygen])},
+                })
+                for num_parties in parties:
+                    for length in lengths:
+                        for mode in modes:
+                            config = {"backend": backend, "bits": bits, "parties": num_parties,
+                                      "length": length, "mode": mode, "benchmark": "protocol"}
+                            phases = benchmark_config(keypair, length, num_parties, mode,
+                                                      warmup, repeats, workers)
+                            results.append({"config": config, "phases": phases})
+                            log(f"  {config_key(config)}: "
+                                f"median {phases['total']['median']:.4f} s, "
+                                f"p90 {phases['total']['p90']:.4f} s")
+    finally:
+        smc_module.set_backend(previous)
+    
+    return {
+        "version": REPORT_VERSION,
+        "created": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {"warmup": warmup, "repeats": repeats, "workers": workers},
+        "results": results,
+    }
+
+
+def save_report(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def load_report(path):
+    with open(path) as f:
+        report = json.load(f)
+    if report.get("version") != REPORT_VERSION:
+        raise ValueError(f"Unsupported benchmark report version in {path}")
+    return report
+
+
+def compare_reports(baseline, current, threshold=0.10, statistic="median", min_seconds=1e-3):
+    """
+    Phases whose statistic grew by more than threshold (a fraction) since baseline
+    Configurations missing from either report are skipped, as are single
+    samples (key generation) and timings below min_seconds in both, which
+    are dominated by noise
+    Returns a list of dicts sorted by slowdown, worst first
+    """
+    previous = {config_key(entry["config"]): entry["phases"] for entry in baseline["results"]}
+    regressions = []
+    for entry in current["results"]:
+        key = config_key(entry["config"])
+        if key not in previous:
+            continue
+        for phase, summary in entry["phases"].items():
+            if phase not in previous[key]:
+                continue
+            before, after = previous[key][phase][statistic], summary[statistic]
+            if summary["repeats"] < 2 or max(before, after) < min_seconds:
+                continue
+            ratio = after / before if before > 0 else float("inf")
+            if ratio > 1 + threshold:
+                regressions.append({"config": key, "phase": phase, "baseline": before,
+                                    "current": after, "ratio": ratio})
+    return sorted(regressions, key=lambda r: r["ratio"], reverse=True)
+
+
+def format_report(report, statistic="median"):
+    """Table of one statistic per phase for every configuration"""
+    columns = ["keygen"] + PHASES + ["total"]
+    keys = [config_key(entry["config"]) for entry in report["results"]]
+    width = max([len("Configuration")] + [len(key) for key in keys]) + 2
+    lines = [f"{'Configuration':<{width}}" + "".join(f"{c:>10}" for c in columns)]
+    for key, entry in zip(keys, report["results"]):
+        cells = "".join(f"{entry['phases'][c][statistic]:>10.4f}" if c in entry["phases"]
+                        else f"{'':>10}" for c in columns)
+        lines.append(f"{key:<{width}}{cells}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parametric benchmarks for the SMC protocol")
+    parser.add_argument("--key-bits", type=int, nargs="+", default=[512])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--parties", type=int, nargs="+", default=[4])
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=["baseline"])
+    parser.add_argument("--backends", nargs="+", choices=list(smc_module.BACKENDS))
+    parser.add_argument("--full", action="store_true",
+                        help="sweep key sizes 512-3072, lengths 10-10^6, 2/4/8 parties, "
+                             "all modes and backends")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="JSON report to check for regressions against")
+    parser.add_argument("--regression-threshold", type=float, default=0.10,
+                        help="flag phases slower than baseline by more than this fraction")
+    args = parser.parse_args()
+    
+    sweep = dict(FULL_SWEEP) if args.full else {
+        "key_bits": args.key_bits, "lengths": args.lengths, "parties": args.parties,
+        "modes": args.modes, "backends": args.backends,
+    }
+    print("Running benchmarks...")
+    report = run_sweep(sweep["key_bits"], sweep["lengths"], sweep["parties"], sweep["modes"],
+                       sweep["backends"], args.warmup, args.repeats, args.workers)
+    print("\n" + format_report(report))
+    
+    if args.output:
+        save_report(report, args.output)
+        print(f"\nReport written to {args.output}")
+    
+    if args.compare:
+        regressions = compare_reports(load_report(args.compare), report,
+                                      threshold=args.regression_threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.regression_threshold:.0%}:")
+            for r in regressions:
+                print(f"  {r['config']} {r['phase']}: {r['baseline']:.4f} s -> "
+                      f"{r['current']:.4f} s ({r['ratio']:.2f}x)")
+            sys.exit(1)
+        print(f"\nNo regressions over {args.regression_threshold:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()